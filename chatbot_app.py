@@ -1,9 +1,14 @@
 import argparse
 import logging
+import time
 
 import streamlit as st
 
-from config import BaseChatbotInterfaceConfig, ChatbotInterfaceConfig, vLLMChatbotInterfaceConfig, vLLMModelConfig, OllamaModelConfig
+from config import BaseChatbotInterfaceConfig, ChatbotInterfaceConfig, vLLMChatbotInterfaceConfig, vLLMModelConfig, OllamaModelConfig, ModelComparisonConfig
+from answer_streams import AnswerStream
+from conversation_export import EXPORT_FORMATS, build_conversation_export
+from conversation_store import ConversationStore
+from model_comparison import ComparisonRun
 from tools import retrieve_answer_stream
 from translations import Translator
 
@@ -22,6 +27,7 @@ class App:
 
         self.model = self.config.default_model_local if not self.is_remote else self.config.default_model_remote
         self.nb_previous_questions = self.config.nb_previous_questions
+        self.compared_models = []
 
         user_language = "fr" if st.context.locale and st.context.locale.startswith('fr') else "en"
 
@@ -35,10 +41,32 @@ class App:
         if "expander_state" not in st.session_state:
             st.session_state["expander_state"] = True
 
-        if "messages" in st.session_state and len(st.session_state.messages) > 0:
-            last_message_is_user = st.session_state.messages[-1]["role"] == "user"
-            if last_message_is_user:
-                st.session_state.messages.pop()
+        if "conversation" not in st.session_state:
+            st.session_state.conversation = ConversationStore()
+        else:
+            st.session_state.conversation.touch()
+
+        if "answer_stream" not in st.session_state:
+            st.session_state.answer_stream = None # AnswerStream, or ComparisonRun in comparison mode
+
+        if "comparison_run" not in st.session_state:
+            st.session_state.comparison_run = None
+
+        # A question whose answer is still being generated (or was generated during a rerun) is kept, so the answer can be replayed
+        if len(st.session_state.conversation) > 0:
+            last_message = st.session_state.conversation.last()
+            last_message_is_user = last_message["role"] == "user"
+            answer_stream = st.session_state.answer_stream
+            is_resumable = answer_stream is not None and answer_stream.is_resumable(len(st.session_state.conversation) - 1, last_message["content"])
+            if last_message_is_user and not is_resumable:
+                self.cancel_answer_stream()
+                st.session_state.conversation.pop()
+            
+    def cancel_answer_stream(self):
+        if st.session_state.answer_stream is not None:
+            st.session_state.answer_stream.cancel()
+            st.session_state.answer_stream = None
+
             
     def close_expander(self):
         st.session_state["expander_state"] = False
@@ -74,6 +102,11 @@ class App:
             self.model = st.selectbox(label=self.translator.get('sidebar.model_prompt'), 
                                 options=model_shortlist, 
                                 index=model_shortlist.index(default_model))
+
+            self.compared_models = st.multiselect(label=self.translator.get('sidebar.compare_models'),
+                                                  options=model_shortlist,
+                                                  default=[],
+                                                  help=self.translator.get('sidebar.compare_models_tooltip'))
             
             self.nb_previous_questions = st.number_input(label=self.translator.get('sidebar.previous_questions'),
                                     value=self.nb_previous_questions,
@@ -93,69 +126,141 @@ class App:
                          help=self.translator.get('sidebar.reset_help'),
                          use_container_width=True,
                          on_click=self.open_expander):  
-                st.session_state.messages = []
+                self.cancel_answer_stream()
+                st.session_state.conversation.clear()
+                st.session_state.comparison_run = None
                 st.rerun()
+
+            with st.popover(self.translator.get('export.title'), use_container_width=True, icon=":material/download:"):
+                export_format = st.selectbox(label=self.translator.get('export.format'),
+                                             options=list(EXPORT_FORMATS.keys()),
+                                             key="export_format")
+
+                # The file is only built in the run where it is requested, streamed from the conversation store, and is not kept in the page afterwards
+                if st.button(self.translator.get('export.prepare'),
+                             key="prepare_export",
+                             disabled=len(st.session_state.conversation) == 0,
+                             use_container_width=True):
+                    st.download_button(label=self.translator.get('download'),
+                                       data=build_conversation_export(st.session_state.conversation, export_format),
+                                       file_name=f"chat_conversation.{export_format}",
+                                       mime=EXPORT_FORMATS[export_format],
+                                       key="download_export",
+                                       on_click='ignore',
+                                       use_container_width=True)
                 
 
         return self.model, self.system_prompt
     
     def main(self):
 
-        def display_download_button(content, key):
-            st.download_button(
-                label=self.translator.get('download'), 
-                data=content, 
-                file_name="chat_conversation.txt",
-                key=key,
-                on_click='ignore'
-            )
+        # Show the answers of a comparison side by side, refreshing them until every model is done
+        def display_comparison(run):
+            columns = st.columns(len(run.streams))
+            placeholders = []
+            for column, metrics in zip(columns, run.metrics):
+                with column:
+                    st.markdown(f"**{metrics.model}**")
+                    placeholders.append((st.empty(), st.empty()))
+
+            while True:
+                is_done = run.done
+                for (answer_placeholder, metrics_placeholder), stream, metrics in zip(placeholders, run.streams, run.metrics):
+                    answer_placeholder.markdown(stream.text(), unsafe_allow_html=True)
+                    if stream.done and metrics.error:
+                        metrics_placeholder.caption(metrics.error)
+                    elif stream.done:
+                        metrics_placeholder.caption(self.translator.get('comparison.metrics').format(ttft=metrics.ttft or 0,
+                                                                                                     tokens_per_second=metrics.tokens_per_second,
+                                                                                                     latency=metrics.latency or 0))
+                if is_done:
+                    break
+                time.sleep(ModelComparisonConfig.refresh_interval)
+
+        def display_comparison_messages():
+            conversation = st.session_state.conversation
+            if len(conversation) > 0 and conversation.last()["role"] == "user":
+
+                prompt_window = conversation.recent(2 * self.nb_previous_questions + 1)
+                question_idx = len(conversation) - 1
+                question = prompt_window[-1]["content"]
+
+                run = st.session_state.answer_stream
+                if not isinstance(run, ComparisonRun) or not run.is_resumable(question_idx, question):
+                    self.cancel_answer_stream()
+                    run = ComparisonRun(self.compared_models, question_idx, question,
+                                        language=st.session_state.language,
+                                        is_remote=self.is_remote,
+                                        hyperparams=self.hyperparams,
+                                        custom_system_prompt=self.system_prompt,
+                                        previous_messages=prompt_window[:-1],
+                                        nb_previous_questions=self.nb_previous_questions,
+                                        engine=self.engine)
+                    st.session_state.answer_stream = run
+
+                with st.chat_message("assistant"):
+                    display_comparison(run)
+
+                # The first selected model's answer becomes the conversation history for the next questions
+                conversation.append("assistant", run.streams[0].text(),
+                                    nb_previous_questions=self.nb_previous_questions,
+                                    model=run.metrics[0].model,
+                                    ttft=run.metrics[0].ttft,
+                                    latency=run.metrics[0].latency)
+                st.session_state.answer_stream = None
+                st.session_state.comparison_run = run
 
         def display_retrieval_messages():
-            if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
+            conversation = st.session_state.conversation
+            if len(conversation) > 0 and conversation.last()["role"] == "user":
+
+                # Only the prompt window is needed to build the prompt; it is resident in memory
+                prompt_window = conversation.recent(2 * self.nb_previous_questions + 1)
+                question_idx = len(conversation) - 1
+                question = prompt_window[-1]["content"]
 
                 with st.spinner(self.translator.get('processing'), show_time=False):
-                    result_generator = retrieve_answer_stream(
-                        st.session_state.messages[-1]["content"],
-                        language=st.session_state.language,
-                        is_remote=self.is_remote,
-                        hyperparams=self.hyperparams,
-                        chat_model=self.model,
-                        custom_system_prompt=self.system_prompt,
-                        previous_messages=st.session_state.messages[:-1],
-                        nb_previous_questions=self.nb_previous_questions,
-                        engine=self.engine
-                    )
-                    
-                    # Create a wrapper generator that captures the full answer
-                    class StreamCapture:
-                        def __init__(self, generator):
-                            self.generator = generator
-                            self.full_answer = ""
-                        
-                        def __iter__(self):
-                            for chunk in self.generator:
-                                self.full_answer += chunk
-                                yield chunk
-                    
-                    stream_capture = StreamCapture(result_generator)
-                    answer = ""
-                    
+                    # Reattach to the generation started before a rerun, if any, instead of generating the answer again
+                    answer_stream = st.session_state.answer_stream
+                    if not isinstance(answer_stream, AnswerStream) or not answer_stream.is_resumable(question_idx, question):
+                        self.cancel_answer_stream()
+                        result_generator = retrieve_answer_stream(
+                            question,
+                            language=st.session_state.language,
+                            is_remote=self.is_remote,
+                            hyperparams=self.hyperparams,
+                            chat_model=self.model,
+                            custom_system_prompt=self.system_prompt,
+                            previous_messages=prompt_window[:-1],
+                            nb_previous_questions=self.nb_previous_questions,
+                            engine=self.engine
+                        )
+                        answer_stream = AnswerStream(result_generator, question_idx, question, model=self.model)
+                        st.session_state.answer_stream = answer_stream
+
                     with st.container():
-                        st.write_stream(stream_capture)
-                        
-                    # Get the captured answer
-                    answer = stream_capture.full_answer
+                        st.write_stream(answer_stream.replay())
 
-                    st.session_state.messages.append({"role": "assistant", "content": answer, "nb_previous_questions": self.nb_previous_questions})
+                    answer = answer_stream.text()
 
-                display_download_button(answer, key=f"download_{st.session_state.profiling_counter}")
+                    conversation.append("assistant", answer,
+                                        nb_previous_questions=self.nb_previous_questions,
+                                        model=answer_stream.model,
+                                        ttft=answer_stream.ttft,
+                                        latency=answer_stream.latency)
+                    st.session_state.answer_stream = None
 
         def process_incoming_input():
             if user_input := st.chat_input(self.translator.get('chat_input'),
                                            on_submit=self.close_expander):
+                # A new question replaces the one still waiting for its answer
+                if len(st.session_state.conversation) > 0 and st.session_state.conversation.last()["role"] == "user":
+                    self.cancel_answer_stream()
+                    st.session_state.conversation.pop()
+
                 with st.chat_message("user"):
                     st.markdown(user_input)
-                st.session_state.messages.append({"role":"user", "content":user_input})
+                st.session_state.conversation.append("user", user_input)
                 st.empty()
 
         st.set_page_config(
@@ -174,27 +279,28 @@ class App:
 
         _, self.system_prompt = self.sidebar_config()
 
-        if "messages" not in st.session_state:
-            st.session_state.messages = []
-
-        previous_messages = []
+        st.session_state.conversation.set_prompt_window(self.nb_previous_questions)
 
-        for idx, message in enumerate(st.session_state.messages):
+        # Messages older than the prompt window are read back from disk as they are displayed
+        comparison_run = st.session_state.comparison_run
+        for idx, message in enumerate(st.session_state.conversation):
             is_assistant = message["role"] == "assistant"
             if is_assistant:
                 with st.chat_message(message["role"]):
-                    st.markdown(message["content"], unsafe_allow_html=True)
-
-                display_download_button(message.get("content", ""), key=f"download_{idx}") # only 1 in 2 messages (the assistant's) should have a download button
+                    if comparison_run is not None and idx == comparison_run.question_idx + 1:
+                        display_comparison(comparison_run)
+                    else:
+                        st.markdown(message["content"], unsafe_allow_html=True)
             else:
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"], unsafe_allow_html=True)
 
-            previous_messages.append(message)
-
         process_incoming_input()
 
-        display_retrieval_messages()
+        if len(self.compared_models) >= 2:
+            display_comparison_messages()
+        else:
+            display_retrieval_messages()
 
 if __name__ == '__main__':
     default_mode = ChatbotInterfaceConfig.default_mode
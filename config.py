@@ -36,6 +36,11 @@ class vLLMChatbotInterfaceConfig(BaseChatbotInterfaceConfig):
     language = "en"
     nb_previous_questions = 10
 
+@dataclass
+class ModelComparisonConfig:
+    max_concurrent_models = 2 # models generating at the same time; keep below what the backend can serve at once (e.g. OLLAMA_MAX_LOADED_MODELS, GPU memory)
+    refresh_interval = 0.1 # seconds between two refreshes of the side-by-side answers
+
 @dataclass
 class PromptTemplateType:
     minimalist: str = """You are a helpful assistant. 
@@ -102,3 +107,37 @@ class vLLMModelConfig:
         "max_num_batched_tokens":8000,
         "max_num_seqs":2
     }
+
+    # optional: render the chat template and tokenize the prompt in the app, then submit token ids to the /completions endpoint.
+    # Already-seen turns are not tokenized again, and the server receives byte-identical prefixes for its prefix cache.
+    ClientSideTemplating = {
+        "enabled":False,
+        "tokenizer":EngineArgs["model_name"], # loaded with transformers; set HF_HUB_OFFLINE=1 once downloaded
+        "chat_template":"chat_template_llama3.2_json.jinja",
+        "segment_delimiter":"<|eot_id|>", # the prompt is tokenized one message at a time, split after this special token
+        "cache_size":1024 # number of tokenized messages kept in memory
+    }
+
+@dataclass
+class LoadTestConfig:
+    '''
+    Default values for the load-testing harness (src/load_testing.py); every value can be overridden from the command line
+    '''
+
+    concurrency_levels = [1, 2, 4, 8] # number of simultaneous sessions, swept in order to find the saturation point
+    sessions_per_level = 16
+    arrival_rate = 1.0 # new sessions per second, following a Poisson process (0 = all sessions arrive at once)
+    max_turns = 4 # each session asks between 1 and max_turns questions
+    think_time = 5.0 # mean number of seconds a user takes to read the answer before asking the next question
+    french_ratio = 0.3 # share of the sessions conducted in French
+    stand_in_port = 8100
+    stand_in_token_rate = 40 # tokens per second generated by each sequence of the stand-in server
+    stand_in_prefill_latency = 0.15 # seconds before the stand-in server emits the first token
+    stand_in_answer_tokens = 120
+
+@dataclass
+class ConversationStoreConfig:
+    db_path = ".conversations/conversations.db" # every message is appended to this SQLite file; only the prompt window stays in memory
+    max_resident_chars = 100_000 # per session; older messages beyond this budget are only kept on disk
+    session_ttl = 6 * 3600 # seconds without activity after which a session's messages are deleted from disk
+    reclaim_interval = 600 # minimum number of seconds between two sweeps of the expired sessions
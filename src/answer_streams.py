@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+
+from oai import abort_stream
+
+class AnswerStream:
+    '''
+    Consumes an answer generator in a background thread owned by the session, buffering every chunk as it arrives.
+    A Streamlit rerun interrupts the script, not this thread: the next run reattaches with replay(), which yields the
+    buffered chunks at once then follows the generation until it is done.
+    cancel() interrupts OpenAI-compatible streams (vLLM, remote) right away, even during prefill, by shutting down their
+    connection; other streams (Ollama) are only closed when their next chunk arrives.
+    '''
+
+    def __init__(self, generator, question_idx, question, model=None):
+        self.question_idx = question_idx
+        self.question = question
+        self.model = model
+        self.ttft = None # seconds until the first chunk
+        self.latency = None # seconds until the end of the generation
+        self.chunks = []
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self._condition = threading.Condition()
+        self._generator = generator
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def _consume(self):
+        start_time = time.perf_counter()
+        try:
+            for chunk in self._generator:
+                if self.cancelled:
+                    break
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - start_time
+                with self._condition:
+                    self.chunks.append(chunk)
+                    self._condition.notify_all()
+        except Exception as e:
+            if not self.cancelled: # aborting the connection makes the stream fail
+                logging.error(f"Answer stream error: {e}")
+                self.error = e
+        finally:
+            if self.cancelled and hasattr(self._generator, "close"):
+                self._generator.close() # releases the backend connection
+            self.latency = time.perf_counter() - start_time
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    # Whether this stream answers the given question of the conversation and can still be replayed
+    def is_resumable(self, question_idx, question):
+        return self.question_idx == question_idx and self.question == question and self.error is None and not self.cancelled
+
+    def replay(self):
+        idx = 0
+        while True:
+            with self._condition:
+                while idx >= len(self.chunks) and not self.done:
+                    self._condition.wait()
+                new_chunks = self.chunks[idx:]
+                is_done = self.done
+
+            idx += len(new_chunks)
+            if new_chunks:
+                yield "".join(new_chunks)
+
+            if is_done and idx >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    # Block until the generation is over, without raising its error
+    def wait(self):
+        self._thread.join()
+
+    def text(self):
+        with self._condition:
+            return "".join(self.chunks)
+
+    def cancel(self):
+        self.cancelled = True
+        abort_stream(self._thread.ident)
@@ -0,0 +1,58 @@
+import json
+
+EXPORT_FORMATS = {
+    "txt": "text/plain",
+    "md": "text/markdown",
+    "json": "application/json"
+}
+
+# Group the messages into question/answer turns, one turn at a time, so the conversation never has to be fully in memory
+def iter_turns(messages):
+    turn = None
+    for message in messages:
+        if message["role"] == "user":
+            if turn is not None:
+                yield turn
+            turn = {"question": message["content"], "answer": None}
+        else:
+            if turn is None:
+                turn = {"question": None, "answer": None}
+            turn.update({"answer": message["content"],
+                         "model": message.get("model"),
+                         "ttft": message.get("ttft"),
+                         "latency": message.get("latency")})
+            yield turn
+            turn = None
+
+    if turn is not None:
+        yield turn
+
+def format_timing(turn):
+    details = [turn[key] for key in ("model",) if turn.get(key)]
+    if turn.get("ttft") is not None:
+        details.append(f"TTFT {turn['ttft']:.2f}s")
+    if turn.get("latency") is not None:
+        details.append(f"{turn['latency']:.2f}s")
+    return ", ".join(details)
+
+# Yield the export file piece by piece, in the given format (see EXPORT_FORMATS)
+def stream_conversation_export(messages, export_format="txt"):
+    if export_format == "json":
+        yield "["
+        for idx, turn in enumerate(iter_turns(messages)):
+            yield ("," if idx > 0 else "") + "\n  " + json.dumps(turn, ensure_ascii=False)
+        yield "\n]\n"
+        return
+
+    for idx, turn in enumerate(iter_turns(messages), start=1):
+        timing = format_timing(turn)
+        if export_format == "md":
+            yield f"## Question {idx}\n\n{turn['question'] or ''}\n\n"
+            yield f"### Answer{f' ({timing})' if timing else ''}\n\n{turn['answer'] or ''}\n\n---\n\n"
+        else:
+            yield f"Question {idx}:\n{turn['question'] or ''}\n\n"
+            yield f"Answer{f' ({timing})' if timing else ''}:\n{turn['answer'] or ''}\n\n{'-' * 80}\n\n"
+
+# Build the export file, as bytes (the data types st.download_button accepts do not include generators or temporary files)
+def build_conversation_export(messages, export_format="txt"):
+    return b"".join(piece.encode("utf-8") for piece in stream_conversation_export(messages, export_format))
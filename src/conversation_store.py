@@ -0,0 +1,198 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) # Add the parent directory to sys.path
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+from config import ConversationStoreConfig
+
+# Fields of a message, in the order of the in-memory tuples
+MESSAGE_FIELDS = ("role", "content", "nb_previous_questions", "model", "ttft", "latency")
+_FIELDS_SQL = ", ".join(MESSAGE_FIELDS)
+
+_last_reclaim_time = 0.0
+_reclaim_lock = threading.Lock()
+
+# Sessions whose ConversationStore is still alive in this process; they are never reclaimed by the TTL sweep
+_live_session_ids = set()
+_live_sessions_lock = threading.Lock()
+
+@contextmanager
+def _connect(db_path):
+    connection = sqlite3.connect(db_path, timeout=10)
+    try:
+        with connection: # commits, or rolls back on error
+            yield connection
+    finally:
+        connection.close()
+
+def _init_db(db_path):
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    with _connect(db_path) as connection:
+        connection.execute("PRAGMA journal_mode=WAL") # lets concurrent sessions read while another one writes
+        connection.execute("""CREATE TABLE IF NOT EXISTS messages (
+                                session_id TEXT NOT NULL,
+                                idx INTEGER NOT NULL,
+                                role TEXT NOT NULL,
+                                content TEXT NOT NULL,
+                                nb_previous_questions INTEGER,
+                                model TEXT,
+                                ttft REAL,
+                                latency REAL,
+                                PRIMARY KEY (session_id, idx))""")
+
+        # Databases created before the answer metadata was stored
+        existing_columns = {row[1] for row in connection.execute("PRAGMA table_info(messages)")}
+        for column, column_type in (("model", "TEXT"), ("ttft", "REAL"), ("latency", "REAL")):
+            if column not in existing_columns:
+                connection.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+        connection.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL NOT NULL)")
+
+def _delete_session(db_path, session_id):
+    with _connect(db_path) as connection:
+        connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+# Called when a ConversationStore is garbage collected, i.e. when its Streamlit session has ended
+def _end_session(db_path, session_id):
+    with _live_sessions_lock:
+        _live_session_ids.discard(session_id)
+    _delete_session(db_path, session_id)
+
+# Delete the messages of the sessions inactive for more than session_ttl seconds that are no longer live
+# (e.g. left behind by an earlier process); live sessions are deleted when they end
+def reclaim_expired_sessions(db_path=ConversationStoreConfig.db_path, session_ttl=ConversationStoreConfig.session_ttl):
+    expiry_time = time.time() - session_ttl
+    with _connect(db_path) as connection:
+        expired_session_ids = [row[0] for row in connection.execute("SELECT session_id FROM sessions WHERE last_access < ?", (expiry_time,))]
+
+    with _live_sessions_lock:
+        orphan_session_ids = [session_id for session_id in expired_session_ids if session_id not in _live_session_ids]
+
+    for session_id in orphan_session_ids:
+        _delete_session(db_path, session_id)
+
+def _reclaim_if_due(db_path):
+    global _last_reclaim_time
+
+    with _reclaim_lock:
+        if time.time() - _last_reclaim_time < ConversationStoreConfig.reclaim_interval:
+            return
+        _last_reclaim_time = time.time()
+
+    reclaim_expired_sessions(db_path)
+
+# Optional fields (answer metadata) are only included when set
+def _to_dict(message):
+    return {field: value for field, value in zip(MESSAGE_FIELDS, message) if value is not None or field in ("role", "content")}
+
+class ConversationStore:
+    '''
+    Conversation of one Streamlit session. Every message is appended to a SQLite file; only the messages of the
+    active prompt window (and at most max_resident_chars characters) are kept in memory, as compact tuples.
+    Older messages are read back lazily from disk when the whole conversation is displayed or downloaded.
+    The session's messages are deleted from disk when the store is garbage collected, i.e. when the Streamlit session ends.
+    '''
+
+    def __init__(self, db_path=ConversationStoreConfig.db_path, max_resident_chars=ConversationStoreConfig.max_resident_chars):
+        self.session_id = uuid.uuid4().hex
+        self.db_path = db_path
+        self.max_resident_chars = max_resident_chars
+        self.resident_window = 2
+        self.resident = deque() # MESSAGE_FIELDS tuples of the last messages
+        self.resident_chars = 0
+        self.length = 0
+
+        _init_db(self.db_path)
+        with _live_sessions_lock:
+            _live_session_ids.add(self.session_id)
+        weakref.finalize(self, _end_session, self.db_path, self.session_id)
+
+        _reclaim_if_due(self.db_path)
+        self.touch()
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        # Messages no longer resident are streamed from disk, one row at a time
+        first_resident_idx = self.length - len(self.resident)
+        if first_resident_idx > 0:
+            with _connect(self.db_path) as connection:
+                cursor = connection.execute(f"SELECT {_FIELDS_SQL} FROM messages WHERE session_id = ? AND idx < ? ORDER BY idx",
+                                            (self.session_id, first_resident_idx))
+                for row in cursor:
+                    yield _to_dict(row)
+
+        for message in list(self.resident):
+            yield _to_dict(message)
+
+    def touch(self):
+        with _connect(self.db_path) as connection:
+            connection.execute("INSERT OR REPLACE INTO sessions (session_id, last_access) VALUES (?, ?)", (self.session_id, time.time()))
+
+    # Keep the last nb_previous_questions Q&A pairs (plus the current question and answer) in memory
+    def set_prompt_window(self, nb_previous_questions):
+        self.resident_window = 2 * nb_previous_questions + 2
+        self._evict()
+
+    # model, ttft and latency (in seconds) describe how an answer was generated, for the conversation export
+    def append(self, role, content, nb_previous_questions=None, model=None, ttft=None, latency=None):
+        message = (role, content, nb_previous_questions, model, ttft, latency)
+        with _connect(self.db_path) as connection:
+            connection.execute(f"INSERT INTO messages (session_id, idx, {_FIELDS_SQL}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (self.session_id, self.length, *message))
+            connection.execute("INSERT OR REPLACE INTO sessions (session_id, last_access) VALUES (?, ?)", (self.session_id, time.time()))
+
+        self.resident.append(message)
+        self.resident_chars += len(content)
+        self.length += 1
+        self._evict()
+
+    def pop(self):
+        if self.length == 0:
+            raise IndexError("pop from an empty conversation")
+
+        message = self.recent(1)[0]
+        with _connect(self.db_path) as connection:
+            connection.execute("DELETE FROM messages WHERE session_id = ? AND idx = ?", (self.session_id, self.length - 1))
+
+        if self.resident:
+            self.resident_chars -= len(self.resident.pop()[1])
+        self.length -= 1
+        return message
+
+    def clear(self):
+        with _connect(self.db_path) as connection:
+            connection.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+
+        self.resident.clear()
+        self.resident_chars = 0
+        self.length = 0
+
+    def last(self):
+        return self.recent(1)[0] if self.length > 0 else None
+
+    # Return the last nb_messages messages, reading the ones no longer resident from disk
+    def recent(self, nb_messages):
+        nb_messages = min(nb_messages, self.length)
+        if nb_messages <= 0:
+            return []
+
+        if nb_messages <= len(self.resident):
+            return [_to_dict(message) for message in list(self.resident)[-nb_messages:]]
+
+        with _connect(self.db_path) as connection:
+            rows = connection.execute(f"SELECT {_FIELDS_SQL} FROM messages WHERE session_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                                      (self.session_id, self.length - nb_messages, self.length - len(self.resident))).fetchall()
+        return [_to_dict(row) for row in rows] + [_to_dict(message) for message in self.resident]
+
+    def _evict(self):
+        # The last message always stays resident, whatever its size
+        while len(self.resident) > self.resident_window or (len(self.resident) > 1 and self.resident_chars > self.max_resident_chars):
+            self.resident_chars -= len(self.resident.popleft()[1])
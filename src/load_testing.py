@@ -0,0 +1,273 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) # Add the parent directory to sys.path
+import argparse
+import csv
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import (ChatbotInterfaceConfig, vLLMChatbotInterfaceConfig, OllamaModelConfig, vLLMModelConfig,
+                    LoadTestConfig)
+
+# Synthetic questions asked by the simulated users, in the order a researcher would typically ask them
+QUESTIONS_EN = [
+    "What are the rules for overtime pay under the Canada Labour Code?",
+    "How many weeks of vacation is an employee entitled to after five years of service?",
+    "Can an employer refuse a request for flexible work arrangements?",
+    "What are the obligations of an employer regarding workplace harassment and violence?",
+    "How is the general holiday pay calculated for a part-time employee?",
+    "What notice must be given before a group termination of employment?",
+    "Is an employee entitled to bereavement leave during the probation period?",
+    "What are the steps to file a complaint for unpaid wages?",
+]
+
+QUESTIONS_FR = [
+    "Quelles sont les règles pour le paiement des heures supplémentaires selon le Code canadien du travail?",
+    "Combien de semaines de vacances un employé a-t-il droit après cinq ans de service?",
+    "Un employeur peut-il refuser une demande de modalités de travail flexibles?",
+    "Quelles sont les obligations de l'employeur en matière de harcèlement et de violence au travail?",
+    "Comment l'indemnité de jour férié est-elle calculée pour un employé à temps partiel?",
+    "Quel préavis doit être donné avant un licenciement collectif?",
+    "Un employé a-t-il droit à un congé de décès pendant sa période de probation?",
+    "Quelles sont les étapes pour déposer une plainte pour salaire impayé?",
+]
+
+STAND_IN_WORDS = ["The", " Canada", " Labour", " Code", " provides", " that", " an", " employee", " is", " entitled",
+                  " to", " the", " standard", " protections", ",", " subject", " to", " the", " regulations", "."]
+
+@dataclass
+class RequestResult:
+    concurrency: int
+    session_id: int
+    turn: int
+    language: str
+    prompt_chars: int
+    ttft: float # time to first token, in seconds
+    latency: float # end-to-end latency, in seconds
+    nb_tokens: int # each streamed chunk counts as one token
+    error: str = ""
+
+    @property
+    def tokens_per_second(self):
+        # The first token arrives before the decode interval starts
+        decode_time = self.latency - self.ttft
+        return (self.nb_tokens - 1) / decode_time if self.nb_tokens > 1 and decode_time > 0 else 0.0
+
+# Nearest-rank percentile; values must be sorted
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+    Answers like a vLLM (OpenAI-compatible SSE) or Ollama (NDJSON) streaming server without a GPU.
+    The number of sequences generated at once is capped like vLLM's max_num_seqs; extra requests wait in a queue.
+    '''
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        is_ollama = self.path.rstrip("/").endswith("/api/chat")
+
+        with self.server.sequence_slots:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson" if is_ollama else "text/event-stream")
+            self.end_headers()
+
+            time.sleep(self.server.prefill_latency)
+
+            for idx in range(self.server.answer_tokens):
+                token = STAND_IN_WORDS[idx % len(STAND_IN_WORDS)]
+                if is_ollama:
+                    chunk = {"model": body.get("model", ""), "created_at": "", "message": {"role": "assistant", "content": token}, "done": False}
+                    self.wfile.write((json.dumps(chunk) + "\n").encode("utf-8"))
+                else:
+                    chunk = {"id": "stand-in", "object": "chat.completion.chunk", "model": body.get("model", ""),
+                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(1 / self.server.token_rate)
+
+            if is_ollama:
+                chunk = {"model": body.get("model", ""), "created_at": "", "message": {"role": "assistant", "content": ""}, "done": True}
+                self.wfile.write((json.dumps(chunk) + "\n").encode("utf-8"))
+            else:
+                self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+def start_stand_in_server(port, max_num_seqs, token_rate, prefill_latency, answer_tokens):
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInHandler)
+    server.daemon_threads = True
+    server.sequence_slots = threading.BoundedSemaphore(max_num_seqs)
+    server.token_rate = token_rate
+    server.prefill_latency = prefill_latency
+    server.answer_tokens = answer_tokens
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def get_stream_function(engine, api_url, api_key):
+    # Imported here so that OLLAMA_HOST can be set (e.g. to target the stand-in server) before the Ollama client is created
+    from local import get_ollama_answer_local_stream
+    from local_vllm import get_vllm_answer_stream, get_vllm_answer_tokenized_stream
+
+    if engine == "ollama":
+        return get_ollama_answer_local_stream
+
+    def stream(chat_model, messages, hyperparams):
+        if vLLMModelConfig.ClientSideTemplating["enabled"]:
+            return get_vllm_answer_tokenized_stream(chat_model, messages, hyperparams, vLLMModelConfig.ClientSideTemplating,
+                                                    vLLMModelConfig.EngineArgs["ctx_window"], api_key=api_key, api_url=api_url)
+        return get_vllm_answer_stream(chat_model, messages, hyperparams, api_key=api_key, api_url=api_url)
+
+    return stream
+
+def run_session(session_id, concurrency, stream_function, args, rng):
+    from tools import retrieve_messages
+
+    language = "fr" if rng.random() < args.french_ratio else "en"
+    questions = QUESTIONS_FR if language == "fr" else QUESTIONS_EN
+    nb_turns = rng.randint(1, args.max_turns)
+    first_question = rng.randrange(len(questions))
+
+    previous_messages = []
+    results = []
+
+    for turn in range(nb_turns):
+        question = questions[(first_question + turn) % len(questions)]
+
+        messages, chat_model, hyperparams = retrieve_messages(question, language, False, args.model, args.hyperparams,
+                                                              None, previous_messages, args.nb_previous_questions)
+        prompt_chars = sum(len(message["content"]) for message in messages)
+
+        answer = ""
+        nb_tokens = 0
+        ttft = 0.0
+        error = ""
+        start_time = time.perf_counter()
+        try:
+            for chunk in stream_function(chat_model, messages, hyperparams):
+                if nb_tokens == 0:
+                    ttft = time.perf_counter() - start_time
+                nb_tokens += 1
+                answer += chunk
+            if nb_tokens == 0:
+                error = "empty answer"
+        except Exception as e:
+            error = str(e)[:200]
+        latency = time.perf_counter() - start_time
+
+        results.append(RequestResult(concurrency, session_id, turn, language, prompt_chars, ttft, latency, nb_tokens, error))
+
+        previous_messages.append({"role": "user", "content": question})
+        previous_messages.append({"role": "assistant", "content": answer, "nb_previous_questions": args.nb_previous_questions})
+
+        if turn < nb_turns - 1 and args.think_time > 0:
+            time.sleep(rng.expovariate(1 / args.think_time))
+
+    return results
+
+def run_level(concurrency, stream_function, args):
+    rng = random.Random(args.seed + concurrency)
+    futures = []
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for session_id in range(args.sessions):
+            futures.append(executor.submit(run_session, session_id, concurrency, stream_function, args, random.Random(rng.random())))
+            if args.arrival_rate > 0:
+                time.sleep(rng.expovariate(args.arrival_rate))
+    wall_time = time.perf_counter() - start_time
+
+    results = [result for future in futures for result in future.result()]
+    return results, wall_time
+
+def summarize_level(concurrency, results, wall_time):
+    successes = [result for result in results if not result.error]
+    ttfts = sorted(result.ttft for result in successes)
+    latencies = sorted(result.latency for result in successes)
+    tokens_per_second = sorted(result.tokens_per_second for result in successes)
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "error_rate": round((len(results) - len(successes)) / len(results), 3) if results else 0.0,
+        "ttft_p50": round(percentile(ttfts, 50), 3),
+        "ttft_p95": round(percentile(ttfts, 95), 3),
+        "ttft_p99": round(percentile(ttfts, 99), 3),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "tokens_per_second_p50": round(percentile(tokens_per_second, 50), 1), # per sequence
+        "throughput": round(sum(result.nb_tokens for result in successes) / wall_time, 1) if wall_time > 0 else 0.0 # all sequences
+    }
+
+def print_summary(summaries):
+    columns = list(summaries[0].keys())
+    print(" | ".join(f"{column:>12}" for column in columns))
+    for summary in summaries:
+        print(" | ".join(f"{str(summary[column]):>12}" for column in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent CLaRA sessions and report latency percentiles per concurrency level.")
+    parser.add_argument("--engine", choices=["ollama", "vllm"], default="vllm")
+    parser.add_argument("--model", type=str, default=None, help="Defaults to the engine's default local model")
+    parser.add_argument("--api-url", type=str, default=os.environ.get("VLLM_API_BASE", "http://localhost:8000/v1"), help="OpenAI-compatible endpoint (vllm engine only)")
+    parser.add_argument("--api-key", type=str, default="123")
+    parser.add_argument("--concurrency", type=str, default=",".join(str(level) for level in LoadTestConfig.concurrency_levels), help="Comma-separated concurrency levels, e.g. 1,2,4,8")
+    parser.add_argument("--sessions", type=int, default=LoadTestConfig.sessions_per_level, help="Sessions simulated per concurrency level")
+    parser.add_argument("--arrival-rate", type=float, default=LoadTestConfig.arrival_rate, help="New sessions per second (0 = all at once)")
+    parser.add_argument("--max-turns", type=int, default=LoadTestConfig.max_turns)
+    parser.add_argument("--think-time", type=float, default=LoadTestConfig.think_time, help="Mean seconds between two questions of a session")
+    parser.add_argument("--french-ratio", type=float, default=LoadTestConfig.french_ratio)
+    parser.add_argument("--nb-previous-questions", type=int, default=ChatbotInterfaceConfig.nb_previous_questions)
+    parser.add_argument("--seed", type=int, default=1837)
+    parser.add_argument("--stand-in", action="store_true", help="Start a local stand-in streaming server and target it instead of a real backend")
+    parser.add_argument("--stand-in-max-num-seqs", type=int, default=vLLMModelConfig.EngineArgs["max_num_seqs"])
+    parser.add_argument("--output", type=str, default=None, help="Optional CSV file receiving every request's measurements")
+    args = parser.parse_args()
+
+    if args.engine == "ollama":
+        args.model = args.model or ChatbotInterfaceConfig.default_model_local
+        args.hyperparams = OllamaModelConfig.HyperparametersAccuracyConfig
+    else:
+        args.model = args.model or vLLMChatbotInterfaceConfig.default_model_local
+        args.hyperparams = vLLMModelConfig.HyperparametersAccuracyConfig
+
+    if args.stand_in:
+        start_stand_in_server(LoadTestConfig.stand_in_port, args.stand_in_max_num_seqs, LoadTestConfig.stand_in_token_rate,
+                              LoadTestConfig.stand_in_prefill_latency, LoadTestConfig.stand_in_answer_tokens)
+        args.api_url = f"http://127.0.0.1:{LoadTestConfig.stand_in_port}/v1"
+        os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{LoadTestConfig.stand_in_port}"
+
+    stream_function = get_stream_function(args.engine, args.api_url, args.api_key)
+
+    all_results = []
+    summaries = []
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        results, wall_time = run_level(concurrency, stream_function, args)
+        all_results += results
+        summaries.append(summarize_level(concurrency, results, wall_time))
+        print(f"Concurrency {concurrency}: {len(results)} requests in {wall_time:.1f}s")
+
+    print_summary(summaries)
+
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(asdict(all_results[0]).keys()) + ["tokens_per_second"])
+            writer.writeheader()
+            for result in all_results:
+                writer.writerow({**asdict(result), "tokens_per_second": round(result.tokens_per_second, 2)})
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
 from oai import oai_compatible_request, oai_compatible_request_stream
 
 def get_vllm_params(chat_model, messages, hyperparams, is_stream, api_key=123):
@@ -27,6 +34,103 @@ def get_vllm_answer_stream(chat_model, messages, hyperparams, api_key=123, api_u
     headers, data = get_vllm_params(chat_model, messages, hyperparams, True, api_key)
     return oai_compatible_request_stream(get_vllm_api_url(api_url), headers, data)
 
+# Client-side templating: the prompt is rendered and tokenized here and submitted as token ids to /completions
+@lru_cache(maxsize=None)
+def get_tokenizer(tokenizer_name):
+    from transformers import AutoTokenizer # only needed for client-side templating; installed with the vLLM build
+    return AutoTokenizer.from_pretrained(tokenizer_name)
+
+@lru_cache(maxsize=None)
+def get_chat_template(chat_template_path):
+    if not os.path.isabs(chat_template_path):
+        chat_template_path = os.path.join(os.path.dirname(__file__), '..', chat_template_path)
+    with open(chat_template_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+class SegmentTokenCache:
+    """LRU cache of the token ids of already-seen prompt segments (one per message), keyed by a hash of their text"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.token_ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_tokenize(self, segment, tokenize):
+        key = hashlib.sha1(segment.encode('utf-8')).digest()
+        with self.lock:
+            if key in self.token_ids:
+                self.token_ids.move_to_end(key)
+                return self.token_ids[key]
+
+        token_ids = tokenize(segment)
+        with self.lock:
+            self.token_ids[key] = token_ids
+            while len(self.token_ids) > self.max_size:
+                self.token_ids.popitem(last=False)
+        return token_ids
+
+_segment_token_caches = {}
+
+# Split the rendered prompt after each delimiter (a special token), so every segment tokenizes the same alone as within the prompt
+def split_prompt_segments(prompt, delimiter):
+    parts = prompt.split(delimiter)
+    segments = [part + delimiter for part in parts[:-1]]
+    if parts[-1]:
+        segments.append(parts[-1])
+    return segments
+
+def tokenize_messages(messages, templating):
+    tokenizer = get_tokenizer(templating["tokenizer"])
+    prompt = tokenizer.apply_chat_template(messages,
+                                           chat_template=get_chat_template(templating["chat_template"]),
+                                           tokenize=False,
+                                           add_generation_prompt=True)
+
+    cache = _segment_token_caches.setdefault(templating["tokenizer"], SegmentTokenCache(templating["cache_size"]))
+
+    # Previous turns are found in the cache; only the new question (and the last answer) get tokenized
+    token_ids = []
+    for segment in split_prompt_segments(prompt, templating["segment_delimiter"]):
+        token_ids += cache.get_or_tokenize(segment, lambda text: tokenizer.encode(text, add_special_tokens=False))
+
+    return token_ids
+
+def get_vllm_tokenized_params(chat_model, token_ids, hyperparams, is_stream, max_model_len, api_key=123):
+    """Prepare vLLM-specific parameters for a token ids prompt"""
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+    # "extra_body" is an OpenAI client notion; the raw /completions request takes these sampling params at the top level
+    sampling_params = {key: value for key, value in hyperparams.items() if key != "extra_body"}
+    sampling_params.update(hyperparams.get("extra_body", {}))
+
+    # The prompt length is exact, so the answer can use all of the remaining context window (the /completions default is only 16 tokens)
+    remaining_tokens = max_model_len - len(token_ids)
+    sampling_params["max_tokens"] = min(sampling_params.get("max_tokens", remaining_tokens), remaining_tokens)
+    logging.debug(f"vLLM prompt: {len(token_ids)} tokens, max_tokens: {sampling_params['max_tokens']}")
+
+    data = {
+        "model": chat_model,
+        "prompt": token_ids,
+        "stream": is_stream,
+        **sampling_params
+    }
+
+    return headers, data
+
+def get_vllm_completions_api_url(api_url):
+    return f"{api_url}/completions"
+
+def get_vllm_answer_tokenized(chat_model, messages, hyperparams, templating, max_model_len, api_key=123, api_url="http://localhost:8000/v1"):
+    headers, data = get_vllm_tokenized_params(chat_model, tokenize_messages(messages, templating), hyperparams, False, max_model_len, api_key)
+    return oai_compatible_request(get_vllm_completions_api_url(api_url), headers, data)
+
+def get_vllm_answer_tokenized_stream(chat_model, messages, hyperparams, templating, max_model_len, api_key=123, api_url="http://localhost:8000/v1"):
+    headers, data = get_vllm_tokenized_params(chat_model, tokenize_messages(messages, templating), hyperparams, True, max_model_len, api_key)
+    return oai_compatible_request_stream(get_vllm_completions_api_url(api_url), headers, data)
+
 if __name__ == "__main__":
     import sys
     import os
@@ -0,0 +1,129 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) # Add the parent directory to sys.path
+import argparse
+import csv
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+from config import ChatbotInterfaceConfig, vLLMChatbotInterfaceConfig, OllamaModelConfig, vLLMModelConfig, ModelComparisonConfig
+from answer_streams import AnswerStream
+from tools import retrieve_answer_stream
+
+@dataclass
+class ModelMetrics:
+    model: str
+    ttft: float | None = None # time to first token, in seconds, once the model got a generation slot
+    latency: float | None = None # end-to-end latency, in seconds
+    nb_tokens: int = 0 # each streamed chunk counts as one token
+    error: str = ""
+
+    @property
+    def tokens_per_second(self):
+        if self.ttft is None or self.latency is None or self.nb_tokens < 2 or self.latency <= self.ttft:
+            return 0.0
+        return (self.nb_tokens - 1) / (self.latency - self.ttft) # the first token arrives before the decode interval
+
+# Generation slots shared by every comparison of the process, i.e. by all sessions
+_generation_slots = threading.Semaphore(ModelComparisonConfig.max_concurrent_models)
+
+# Wait for a generation slot, then time the stream as it is consumed; a run cancelled meanwhile never reaches the backend
+def timed_stream(generator, metrics, slots, is_cancelled):
+    with slots:
+        if is_cancelled():
+            return
+        start_time = time.perf_counter()
+        try:
+            for chunk in generator:
+                if metrics.ttft is None:
+                    metrics.ttft = time.perf_counter() - start_time
+                metrics.nb_tokens += 1
+                yield chunk
+        except Exception as e:
+            metrics.error = str(e)
+            raise
+        finally:
+            metrics.latency = time.perf_counter() - start_time
+
+class ComparisonRun:
+    '''
+    Sends the same question and history to several models, each answer being generated by its own AnswerStream.
+    At most ModelComparisonConfig.max_concurrent_models generate at once across all sessions; the others wait for a slot.
+    Like AnswerStream, a run is owned by the session and survives reruns (see is_resumable and cancel).
+    '''
+
+    def __init__(self, models, question_idx, question, slots=_generation_slots, **retrieval_kwargs):
+        self.question_idx = question_idx
+        self.question = question
+        self.cancelled = False
+        self.metrics = []
+        self.streams = []
+
+        for model in models:
+            metrics = ModelMetrics(model)
+            generator = retrieve_answer_stream(question, chat_model=model, **retrieval_kwargs)
+            self.metrics.append(metrics)
+            self.streams.append(AnswerStream(timed_stream(generator, metrics, slots, lambda: self.cancelled), question_idx, question, model=model))
+
+    @property
+    def done(self):
+        return all(stream.done for stream in self.streams)
+
+    def is_resumable(self, question_idx, question):
+        return self.question_idx == question_idx and self.question == question and not self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+        for stream in self.streams:
+            stream.cancel()
+
+    def wait(self):
+        for stream in self.streams:
+            stream.wait()
+
+    def results(self):
+        return [{**asdict(metrics), "tokens_per_second": round(metrics.tokens_per_second, 1), "answer": stream.text()}
+                for metrics, stream in zip(self.metrics, self.streams)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Send the same question to several models and compare their answers and speed.")
+    parser.add_argument("question", type=str)
+    parser.add_argument("--engine", choices=["ollama", "vllm"], default="ollama")
+    parser.add_argument("--models", type=str, default=None, help="Comma-separated models (defaults to the engine's local shortlist)")
+    parser.add_argument("--language", choices=["en", "fr"], default="en")
+    parser.add_argument("--max-concurrent-models", type=int, default=ModelComparisonConfig.max_concurrent_models)
+    parser.add_argument("--output", type=str, default=None, help="Optional CSV file receiving the answers and metrics")
+    args = parser.parse_args()
+
+    config = ChatbotInterfaceConfig if args.engine == "ollama" else vLLMChatbotInterfaceConfig
+    hyperparams = OllamaModelConfig.HyperparametersAccuracyConfig if args.engine == "ollama" else vLLMModelConfig.HyperparametersAccuracyConfig
+    models = args.models.split(",") if args.models else config.models_shortlist_local
+
+    run = ComparisonRun(models, 0, args.question,
+                        slots=threading.Semaphore(args.max_concurrent_models),
+                        language=args.language,
+                        is_remote=False,
+                        hyperparams=hyperparams,
+                        custom_system_prompt=None,
+                        previous_messages=None,
+                        nb_previous_questions=0,
+                        engine=args.engine)
+    run.wait()
+
+    results = run.results()
+    for result in results:
+        print(f"\n===== {result['model']} =====\n{result['error'] or result['answer']}")
+
+    print(f"\n{'model':>40} | {'ttft':>8} | {'latency':>8} | {'tokens/s':>8} | error")
+    for result in sorted(results, key=lambda result: result["latency"] or float("inf")):
+        print(f"{result['model']:>40} | {result['ttft'] or 0:>8.2f} | {result['latency'] or 0:>8.2f} | {result['tokens_per_second']:>8.1f} | {result['error']}")
+
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
-import requests
 import json
+import socket
+import threading
+
+import requests
+
+# Streaming responses being read, by the ident of the thread reading them (see abort_stream)
+_streaming_responses = {}
 
 # Generic OpenAI-compatible API functions
 def oai_compatible_request(api_url, headers, data):
@@ -7,7 +13,8 @@ def oai_compatible_request(api_url, headers, data):
     response = requests.post(api_url, headers=headers, json=data)
     
     if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
+        choice = response.json()["choices"][0]
+        return choice["message"]["content"] if "message" in choice else choice["text"] # chat or text completion
     else:
         raise Exception(f"Error in API call: {response.status_code} - {response.text}")
 
@@ -18,6 +25,38 @@ def oai_compatible_request_stream(api_url, headers, data):
     if response.status_code != 200:
         raise Exception(f"Error in streaming API call: {response.status_code} - {response.text}")
 
+    _streaming_responses[threading.get_ident()] = response
+    try:
+        yield from _parse_stream(response)
+    finally:
+        _streaming_responses.pop(threading.get_ident(), None)
+        response.close()
+
+# Interrupt the streaming request read by the given thread, even while it waits for its first chunk.
+# Closing the response alone does not wake up a blocked read; shutting down the socket does, and the server sees the disconnection.
+def abort_stream(thread_id):
+    response = _streaming_responses.pop(thread_id, None)
+    if response is None:
+        return
+
+    sock = _get_socket(response)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+def _get_socket(response):
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is None:
+        # http.client detaches the socket from the connection when the server closes it after the response (e.g. HTTP/1.0)
+        fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    return sock
+
+def _parse_stream(response):
     # Create a byte buffer to collect incoming data
     byte_buffer = b""
 
@@ -42,11 +81,11 @@ def oai_compatible_request_stream(api_url, headers, data):
                 chunk = json.loads(json_str)
                 byte_buffer = byte_buffer[chunk_end_idx:]
 
-                # Extract the message
+                # Extract the message (chat completions stream a delta, text completions a text)
                 choices = chunk.get('choices', [])
                 if choices:
                     chunk_message = choices[0].get('delta', {})
-                    content = chunk_message.get("content", "")
+                    content = chunk_message.get("content", "") if 'delta' in choices[0] else choices[0].get("text", "")
                     if content:
                         yield content
             except json.JSONDecodeError:
@@ -1,3 +1,7 @@
+import hashlib
+import json
+import os
+
 import pandas as pd
 from typing import Set
 
@@ -44,59 +48,116 @@ def calculate_metrics(golden_sources: Set[str], retrieved_sources: Set[str]) ->
     
     return total_sources_retrieved, true_positives, total_sources_golden, precision, recall, f1, ratio
 
-def evaluate_dataset_sources(golden_qa: pd.DataFrame, retrieved_qa: pd.DataFrame, qa_citations: pd.DataFrame, output_path: str):
-    nb_retrieved_sources = []
-    nb_correct_sources = []
-    nb_golden_sources = []
-    precisions = []
-    recalls = []
-    f1_scores = []
-    ratios = []
-    
-    # Process each evaluation question
-    for _, retrieved_row in retrieved_qa.iterrows():
-        # Get corresponding gold standard row
-        gold_row = golden_qa[golden_qa['golden_question_id'] == retrieved_row['golden_question_id']].iloc[0]
-        
-        # Get gold sources
-        golden_sources = get_all_sources(gold_row)
-        
-        # Get evaluation sources from qa_citations
-        qa_citations_subset = qa_citations[qa_citations['question_id'] == retrieved_row['question_id']]
-        retrieved_sources = set()
-        
-        # Collect all sources from qa_citations
-        for _, citation in qa_citations_subset.iterrows():
-            if pd.notna(citation.get('url')):
-                retrieved_sources.update(format_url(citation['url']))
-            if pd.notna(citation.get('sections_clc')):
-                retrieved_sources.update(format_toc_sections(citation['sections_clc']))
-            if pd.notna(citation.get('sections_clsr')):
-                retrieved_sources.update(format_toc_sections(citation['sections_clsr']))
-        
-        # Calculate metrics
-        retrieved_sources_nb, correct_sources_nb, golden_sources_nb, precision, recall, f1, ratio = calculate_metrics(golden_sources, retrieved_sources)
-        
-        nb_retrieved_sources.append(retrieved_sources_nb)
-        nb_correct_sources.append(correct_sources_nb)
-        nb_golden_sources.append(golden_sources_nb)
-        precisions.append(precision)
-        recalls.append(recall)
-        f1_scores.append(f1)
-        ratios.append(ratio)
-
-    # Remove answer column
-    retrieved_qa = retrieved_qa.drop(columns=['answer'])
-    
-    # Add metrics to retrieved_qa DataFrame
-    retrieved_qa["retrieved_sources"] = nb_retrieved_sources
-    retrieved_qa["correct_sources"] = nb_correct_sources
-    retrieved_qa["golden_sources"] = nb_golden_sources
-    retrieved_qa['correct_ratio'] = ratios
-    retrieved_qa['precision'] = [round(p, 2) for p in precisions]
-    retrieved_qa['recall'] = [round(r, 2) for r in recalls]
-    retrieved_qa['f1_score'] = [round(f, 2) for f in f1_scores]
-    
+# Accept either a DataFrame or an iterable of DataFrames (e.g. pd.read_csv(path, chunksize=...))
+def iter_chunks(data):
+    if isinstance(data, pd.DataFrame):
+        yield data
+    else:
+        yield from data
+
+# Ids are compared as strings; a chunk read from CSV with a missing value holds integer ids as floats (5 -> 5.0)
+def normalize_id(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def optional_str(value) -> str | None:
+    return None if pd.isna(value) else str(value)
+
+# Keep only the citation fields used for the metrics, grouped by question_id, so the full DataFrame never has to be resident
+def group_citations(qa_citations) -> dict[str, list[tuple]]:
+    citations_by_question = {}
+    for chunk in iter_chunks(qa_citations):
+        columns = [column for column in ('url', 'sections_clc', 'sections_clsr') if column in chunk.columns]
+        for question_id, *values in chunk[['question_id'] + columns].itertuples(index=False, name=None):
+            citation = dict(zip(columns, values))
+            citations_by_question.setdefault(normalize_id(question_id), []).append((optional_str(citation.get('url', None)),
+                                                                           optional_str(citation.get('sections_clc', None)),
+                                                                           optional_str(citation.get('sections_clsr', None))))
+    return citations_by_question
+
+def get_citations_sources(citations: list[tuple]) -> Set[str]:
+    retrieved_sources = set()
+    for url, sections_clc, sections_clsr in citations:
+        if url is not None:
+            retrieved_sources.update(format_url(url))
+        if sections_clc is not None:
+            retrieved_sources.update(format_toc_sections(sections_clc))
+        if sections_clsr is not None:
+            retrieved_sources.update(format_toc_sections(sections_clsr))
+    return retrieved_sources
+
+# Hash of everything the metrics of a question depend on: its answer, its citations and its golden sources
+def get_content_hash(answer, citations: list[tuple], golden_sources: Set[str]) -> str:
+    content = json.dumps([optional_str(answer), sorted(citations, key=str), sorted(golden_sources)])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def load_cache(cache_path: str) -> dict[str, dict]:
+    if not os.path.exists(cache_path):
+        return {}
+    cache = pd.read_csv(cache_path, dtype={'question_id': str, 'content_hash': str, 'correct_ratio': str})
+    return {row['question_id']: row for row in cache.to_dict('records')}
+
+METRICS_COLUMNS = ['retrieved_sources', 'correct_sources', 'golden_sources', 'correct_ratio', 'precision', 'recall', 'f1_score']
+
+def evaluate_dataset_sources(golden_qa: pd.DataFrame, retrieved_qa: pd.DataFrame, qa_citations: pd.DataFrame, output_path: str, cache_path: str | None = None):
+    """
+    retrieved_qa and qa_citations can be DataFrames or iterables of DataFrame chunks.
+    Per-question metrics are cached in cache_path (next to output_path by default) with a hash of the answer, citations and
+    golden sources; on a rerun only the new or changed questions are recomputed.
+    """
+    if cache_path is None:
+        cache_path = os.path.splitext(output_path)[0] + "_cache.csv"
+
+    cache = load_cache(cache_path)
+    golden_sources_by_id = {normalize_id(row['golden_question_id']): get_all_sources(row) for _, row in golden_qa.iterrows()}
+    citations_by_question = group_citations(qa_citations)
+
+    metrics_sums = {'precision': 0.0, 'recall': 0.0, 'f1_score': 0.0}
+    nb_rows = 0
+    output_columns = None
+
+    # Process each evaluation question, one chunk at a time, appending the results to the output file
+    for retrieved_chunk in iter_chunks(retrieved_qa):
+        chunk_metrics = []
+        for _, retrieved_row in retrieved_chunk.iterrows():
+            question_id = normalize_id(retrieved_row['question_id'])
+            golden_sources = golden_sources_by_id[normalize_id(retrieved_row['golden_question_id'])]
+            citations = citations_by_question.get(question_id, [])
+            content_hash = get_content_hash(retrieved_row.get('answer'), citations, golden_sources)
+
+            cached = cache.get(question_id)
+            if cached is None or cached['content_hash'] != content_hash:
+                # Calculate metrics
+                retrieved_sources_nb, correct_sources_nb, golden_sources_nb, precision, recall, f1, ratio = calculate_metrics(golden_sources, get_citations_sources(citations))
+                cached = {'question_id': question_id,
+                          'content_hash': content_hash,
+                          'retrieved_sources': retrieved_sources_nb,
+                          'correct_sources': correct_sources_nb,
+                          'golden_sources': golden_sources_nb,
+                          'correct_ratio': ratio,
+                          'precision': round(precision, 2),
+                          'recall': round(recall, 2),
+                          'f1_score': round(f1, 2)}
+                cache[question_id] = cached
+
+            chunk_metrics.append([cached[column] for column in METRICS_COLUMNS])
+
+        # Remove answer column and add metrics
+        retrieved_chunk = retrieved_chunk.drop(columns=['answer'])
+        retrieved_chunk = pd.concat([retrieved_chunk.reset_index(drop=True), pd.DataFrame(chunk_metrics, columns=METRICS_COLUMNS)], axis=1)
+
+        # Counts are written as integers, whatever the dtype inferred for this chunk
+        for column in ('retrieved_sources', 'correct_sources', 'golden_sources'):
+            retrieved_chunk[column] = retrieved_chunk[column].astype(int)
+
+        for column in metrics_sums:
+            metrics_sums[column] += retrieved_chunk[column].sum()
+        nb_rows += len(retrieved_chunk)
+
+        retrieved_chunk.to_csv(output_path, index=False, mode='w' if output_columns is None else 'a', header=output_columns is None)
+        output_columns = list(retrieved_chunk.columns)
+
     # Add totals row with averages
     totals_row = pd.DataFrame({
         'question_id': [''],
@@ -106,13 +167,13 @@ def evaluate_dataset_sources(golden_qa: pd.DataFrame, retrieved_qa: pd.DataFrame
         'correct_sources': '',
         'golden_sources': '',
         'correct_ratio': ['MEAN'],
-        'precision': [round(retrieved_qa['precision'].mean(), 2)],
-        'recall': [round(retrieved_qa['recall'].mean(), 2)],
-        'f1_score': [round(retrieved_qa['f1_score'].mean(), 2)]
+        'precision': [round(metrics_sums['precision'] / nb_rows, 2) if nb_rows else float('nan')],
+        'recall': [round(metrics_sums['recall'] / nb_rows, 2) if nb_rows else float('nan')],
+        'f1_score': [round(metrics_sums['f1_score'] / nb_rows, 2) if nb_rows else float('nan')]
     })
-    
-    # Concatenate the totals row to retrieved_qa
-    retrieved_qa = pd.concat([retrieved_qa, totals_row], ignore_index=True)
-    
-    # Save updated retrieved_qa to CSV
-    retrieved_qa.to_csv(output_path, index=False)
\ No newline at end of file
+
+    # Append the totals row to the output file, aligned with its columns
+    totals_row.reindex(columns=output_columns or list(totals_row.columns)).to_csv(output_path, index=False, mode='a' if output_columns else 'w', header=not output_columns)
+
+    # Save the per-question results merged with the previous ones
+    pd.DataFrame(list(cache.values()), columns=['question_id', 'content_hash'] + METRICS_COLUMNS).to_csv(cache_path, index=False)
@@ -5,9 +5,9 @@ import time
 
 import streamlit as st
 
-from config import ChatbotInterfaceConfig, PromptTemplateType, OllamaModelConfig
+from config import ChatbotInterfaceConfig, PromptTemplateType, OllamaModelConfig, vLLMModelConfig
 from local import get_ollama_answer_local, get_ollama_answer_local_stream
-from local_vllm import get_vllm_answer, get_vllm_answer_stream
+from local_vllm import get_vllm_answer, get_vllm_answer_stream, get_vllm_answer_tokenized, get_vllm_answer_tokenized_stream
 from remote import get_llm_answer_remote, get_llm_answer_remote_stream
 
 # Get the prompt template based on whether the model is remote or not
@@ -87,7 +87,7 @@ def retrieve_messages(user_question,
     
     return messages, chat_model, hyperparams
 
-@st.cache_data(show_spinner=False, ttl=600)
+@st.cache_data(show_spinner=False, ttl=600, max_entries=100) # bounded, so that cached answers cannot grow with the number of sessions
 def retrieve_answer_local(question,
                       language,
                       is_remote=False,
@@ -107,6 +107,8 @@ def retrieve_answer_local(question,
         answer = get_llm_answer_remote(chat_model, messages, hyperparams)
     elif engine=="ollama":
         answer = get_ollama_answer_local(chat_model, messages, hyperparams)
+    elif engine=="vllm" and vLLMModelConfig.ClientSideTemplating["enabled"]:
+        answer = get_vllm_answer_tokenized(chat_model, messages, hyperparams, vLLMModelConfig.ClientSideTemplating, vLLMModelConfig.EngineArgs["ctx_window"])
     elif engine=="vllm":
         answer = get_vllm_answer(chat_model, messages, hyperparams)
 
@@ -131,13 +133,15 @@ def retrieve_answer_stream(question,
         stream_generator = get_llm_answer_remote_stream(chat_model, messages, hyperparams)
     elif engine=="ollama":
         stream_generator = get_ollama_answer_local_stream(chat_model, messages, hyperparams)
+    elif engine=="vllm" and vLLMModelConfig.ClientSideTemplating["enabled"]:
+        stream_generator = get_vllm_answer_tokenized_stream(chat_model, messages, hyperparams, vLLMModelConfig.ClientSideTemplating, vLLMModelConfig.EngineArgs["ctx_window"])
     elif engine=="vllm":
         stream_generator = get_vllm_answer_stream(chat_model, messages, hyperparams)
 
     return stream_generator
 
 if __name__ == "__main__":
-    from config import vLLMModelConfig, vLLMChatbotInterfaceConfig
+    from config import vLLMChatbotInterfaceConfig
 
     start_time = time.time()
     answer, _, _, _, original_answer = retrieve_answer_local(